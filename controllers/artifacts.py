@@ -0,0 +1,437 @@
+from mcp_config import mcp
+import subprocess, os, uuid
+import gzip, glob, re, shutil, threading
+import select, signal, sys, time
+from collections import deque
+
+# Every test run gets its own spool directory so logs never have to be held in memory
+ARTIFACT_ROOT = os.environ.get("MCP_ARTIFACT_DIR", os.path.join("/tmp", "mcp_runs"))
+LOG_NAME = "test.log.gz"
+CHUNK_SIZE = 64 * 1024
+MAX_RANGE_BYTES = 1024 * 1024
+TAIL_LINES = 50
+
+# Caps on what a caller can ask for, so reading a log stays flat in memory;
+# longer lines are returned in MAX_LINE_BYTES pieces
+MAX_TAIL_LINES = 2000
+MAX_GREP_MATCHES = 1000
+MAX_LINE_BYTES = 4096
+
+# Retention for ARTIFACT_ROOT, applied whenever a new run starts
+MAX_AGE_DAYS = float(os.environ.get("MCP_ARTIFACT_MAX_AGE_DAYS", "7"))
+MAX_TOTAL_MB = float(os.environ.get("MCP_ARTIFACT_MAX_MB", "2048"))
+# Marks a run still in use (holds the owning server's pid); see finish_run()
+ACTIVE_MARKER = ".active"
+# Unmarked runs written to this recently are also left alone
+ACTIVE_GRACE_SECONDS = 600
+
+# Screenshots and reports picked up from the repo after a run
+ARTIFACT_PATTERNS = [
+    "target/surefire-reports/**/*",
+    "target/failsafe-reports/**/*",
+    "test-output/**/*",
+    "build/reports/tests/**/*",
+    "build/test-results/**/*",
+    "**/screenshots/**/*",
+    "junit*.xml",
+    "report*.html",
+]
+SKIP_DIRS = {".git", "node_modules", ".venv", "venv", ".gradle"}
+
+
+def new_run() -> tuple:
+    """
+    Creates a spool directory for a new test run.
+
+    Returns:
+        tuple: (run_id, run_dir)
+    """
+    prune_runs()
+    run_id = uuid.uuid4().hex[:12]
+    run_dir = os.path.join(ARTIFACT_ROOT, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, ACTIVE_MARKER), "w") as f:
+        f.write(str(os.getpid()))
+    return run_id, run_dir
+
+
+def finish_run(run_dir: str) -> None:
+    """
+    Marks a run from new_run() as finished, so retention may prune it.
+    """
+    try:
+        os.remove(os.path.join(run_dir, ACTIVE_MARKER))
+    except FileNotFoundError:
+        pass
+
+
+def _is_live(run_dir: str) -> bool:
+    try:
+        with open(os.path.join(run_dir, ACTIVE_MARKER)) as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        return False
+    # A marker left by a server that has since exited does not count
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def prune_runs() -> None:
+    """
+    Deletes runs older than MAX_AGE_DAYS, then the oldest runs until
+    ARTIFACT_ROOT fits in MAX_TOTAL_MB. Live runs are never deleted.
+    """
+    if not os.path.isdir(ARTIFACT_ROOT):
+        return
+
+    runs = []
+    for entry in os.scandir(ARTIFACT_ROOT):
+        if not entry.is_dir():
+            continue
+        size, last_write = 0, entry.stat().st_mtime
+        for root, _, files in os.walk(entry.path):
+            for f in files:
+                try:
+                    st = os.stat(os.path.join(root, f))
+                except OSError:
+                    continue
+                size += st.st_size
+                last_write = max(last_write, st.st_mtime)
+        runs.append((last_write, size, entry.path))
+
+    now = time.time()
+    total = sum(size for _, size, _ in runs)
+    for last_write, size, path in sorted(runs):
+        # Live runs still count towards the total, they just can't be deleted
+        if _is_live(path) or now - last_write < ACTIVE_GRACE_SECONDS:
+            continue
+        if now - last_write > MAX_AGE_DAYS * 86400 or total > MAX_TOTAL_MB * 1024 * 1024:
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def spool_stream(stream, run_dir: str, name: str = LOG_NAME) -> int:
+    """
+    Copies a binary stream into a gzip file chunk by chunk.
+
+    Returns:
+        int: Number of uncompressed bytes written.
+    """
+    written = 0
+    with gzip.open(os.path.join(run_dir, name), "wb") as out:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def _pump_pipe(pipe, run_dir: str, stop: threading.Event, name: str = LOG_NAME) -> None:
+    """
+    Like spool_stream() for a subprocess pipe, but gives up once the pipe is idle
+    and stop is set, so a stray process holding the pipe cannot keep the log open.
+    """
+    fd = pipe.fileno()
+    with gzip.open(os.path.join(run_dir, name), "wb") as out:
+        while True:
+            ready, _, _ = select.select([fd], [], [], 0.5)
+            if not ready:
+                if stop.is_set():
+                    break
+                continue
+            chunk = os.read(fd, CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
+
+
+def spool_text(text: str, run_dir: str, name: str = LOG_NAME) -> None:
+    with gzip.open(os.path.join(run_dir, name), "wt", encoding="utf-8") as out:
+        out.write(text or "")
+
+
+def _session_rss_mb(session_id: int) -> float:
+    """
+    Sums the RSS of every process in a session (mvn, forked JVMs, browsers and
+    drivers alike). Returns 0 where /proc is not available.
+    """
+    total_pages = 0
+    for pid in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # Fields after "(comm)": state ppid pgrp session ... rss is the 22nd
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[3]) == session_id:
+            total_pages += int(fields[21])
+    return total_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def _wait(proc, timeout: int) -> tuple:
+    """
+    Waits for the process and returns (exit code, peak total memory in MB, CPU seconds).
+    """
+    if not hasattr(os, "wait4"):
+        return proc.wait(timeout=timeout), 0.0, 0.0
+
+    # The command leads its own session, so its session id is its pid
+    peak_mb = 0.0
+    deadline = time.time() + timeout
+    while True:
+        peak_mb = max(peak_mb, _session_rss_mb(proc.pid))
+        # wait4 reports CPU for the process and the children it reaped (e.g. forked JVMs)
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            if not os.path.isdir("/proc"):
+                # Largest single process instead; this includes the pre-exec
+                # high-water mark inherited from the server's fork.
+                # ru_maxrss is in bytes on macOS and kilobytes on Linux
+                rss_kb = usage.ru_maxrss / 1024 if sys.platform == "darwin" else usage.ru_maxrss
+                peak_mb = rss_kb / 1024
+            return proc.returncode, peak_mb, usage.ru_utime + usage.ru_stime
+        if time.time() > deadline:
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        time.sleep(0.5)
+
+
+def run_spooled(
+    cmd: list,
+    run_dir: str,
+    timeout: int = 180,
+    cwd: str = None,
+    usage: dict = None,
+    name: str = LOG_NAME
+):
+    """
+    Runs a command with stdout and stderr streamed to the run's compressed log.
+    The command runs in its own process group, which is killed on timeout.
+
+    Args:
+        usage (dict): If given, filled with duration_s, peak_mem_mb and cpu_s of the run.
+        name (str): Log file in the run directory, defaults to the test log.
+
+    Returns:
+        int | None: Exit code, or None if the command timed out.
+    """
+    started = time.time()
+    # Own session so a timeout can kill forked JVMs and browsers along with the command
+    proc = subprocess.Popen(
+        cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True
+    )
+    stop = threading.Event()
+    pump = threading.Thread(target=_pump_pipe, args=(proc.stdout, run_dir, stop, name), daemon=True)
+    pump.start()
+
+    try:
+        returncode, peak_mem_mb, cpu_s = _wait(proc, timeout)
+        if usage is not None:
+            usage.update(duration_s=time.time() - started, peak_mem_mb=peak_mem_mb, cpu_s=cpu_s)
+    except subprocess.TimeoutExpired:
+        _kill_group(proc)
+        proc.wait()
+        returncode = None
+
+    # Leftover background processes can still hold the pipe; kill them and let
+    # the pump finish the gzip before anyone reads the log
+    pump.join(timeout=5)
+    if pump.is_alive():
+        _kill_group(proc)
+        stop.set()
+        pump.join()
+    proc.stdout.close()
+    return returncode
+
+
+def _kill_group(proc) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def collect_artifacts(repo_path: str, run_dir: str) -> list:
+    """
+    Copies screenshots and test reports from the repo into the run directory.
+
+    Returns:
+        list: Artifact names relative to the run directory.
+    """
+    collected = []
+    seen = set()
+    for pattern in ARTIFACT_PATTERNS:
+        for path in glob.glob(os.path.join(repo_path, pattern), recursive=True):
+            rel = os.path.relpath(path, repo_path)
+            if not os.path.isfile(path) or path in seen or SKIP_DIRS.intersection(rel.split(os.sep)):
+                continue
+            seen.add(path)
+            name = os.path.join("artifacts", rel)
+            target = os.path.join(run_dir, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(path, target)
+            collected.append(name)
+    return collected
+
+
+def list_artifacts(run_dir: str) -> list:
+    entries = []
+    for root, _, files in os.walk(run_dir):
+        for f in sorted(files):
+            if f == ACTIVE_MARKER:
+                continue
+            path = os.path.join(root, f)
+            entries.append((os.path.relpath(path, run_dir), os.path.getsize(path)))
+    return sorted(entries)
+
+
+def _run_dir(run_id: str) -> str:
+    if not re.fullmatch(r"[0-9a-f]{12}", run_id or ""):
+        raise ValueError(f"Invalid run id: {run_id}")
+    run_dir = os.path.realpath(os.path.join(ARTIFACT_ROOT, run_id))
+    if not os.path.isdir(run_dir):
+        raise FileNotFoundError(f"No run {run_id}")
+    return run_dir
+
+
+def _resolve(run_id: str, name: str) -> str:
+    run_dir = _run_dir(run_id)
+    path = os.path.realpath(os.path.join(run_dir, name))
+    if not path.startswith(run_dir + os.sep):
+        raise ValueError(f"Artifact outside run directory: {name}")
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No artifact '{name}' in run {run_id}")
+    return path
+
+
+def _open(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _lines(f):
+    # Like iterating the file, but never holds more than MAX_LINE_BYTES of one line
+    return iter(lambda: f.readline(MAX_LINE_BYTES), b"")
+
+
+def tail_lines(path: str, lines: int = TAIL_LINES) -> str:
+    # deque keeps only the last N lines while the file streams past
+    with _open(path) as f:
+        last = deque(_lines(f), maxlen=min(max(lines, 1), MAX_TAIL_LINES))
+    return b"".join(last)[-MAX_RANGE_BYTES:].decode("utf-8", errors="replace")
+
+
+def read_range(path: str, offset: int = 0, length: int = 65536) -> str:
+    length = max(0, min(length, MAX_RANGE_BYTES))
+    with _open(path) as f:
+        f.seek(max(offset, 0))
+        return f.read(length).decode("utf-8", errors="replace")
+
+
+def grep_lines(path: str, pattern: str, max_matches: int = 200) -> str:
+    regex = re.compile(pattern.encode("utf-8"))
+    max_matches = min(max(max_matches, 1), MAX_GREP_MATCHES)
+    matches, size, number = [], 0, 1
+    with _open(path) as f:
+        for line in _lines(f):
+            if regex.search(line):
+                match = f"{number}: {line.decode('utf-8', errors='replace').rstrip()}"
+                matches.append(match)
+                size += len(match) + 1
+                if len(matches) >= max_matches or size >= MAX_RANGE_BYTES:
+                    matches.append(f"... stopped after {len(matches)} matches")
+                    break
+            # Pieces of one long line share its line number
+            if line.endswith(b"\n"):
+                number += 1
+    return "\n".join(matches)
+
+
+def run_summary(run_id: str, collected: list = None) -> str:
+    """
+    Short footer appended to test results pointing at the spooled log.
+    """
+    summary = f"📁 Run ID: {run_id} (full log: get_run_artifact(run_id=\"{run_id}\", name=\"{LOG_NAME}\"))"
+    if collected:
+        summary += f"\n📎 {len(collected)} artifacts collected (mode=\"list\" to browse)"
+    return summary
+
+
+@mcp.tool()
+def get_run_artifact(
+    run_id: str,
+    name: str = LOG_NAME,
+    mode: str = "tail",
+    lines: int = TAIL_LINES,
+    offset: int = 0,
+    length: int = 65536,
+    pattern: str = "",
+    max_matches: int = 200
+) -> str:
+    return get_run_artifact_fn(
+        run_id=run_id,
+        name=name,
+        mode=mode,
+        lines=lines,
+        offset=offset,
+        length=length,
+        pattern=pattern,
+        max_matches=max_matches
+    )
+
+
+def get_run_artifact_fn(
+    run_id: str,
+    name: str = LOG_NAME,
+    mode: str = "tail",
+    lines: int = TAIL_LINES,
+    offset: int = 0,
+    length: int = 65536,
+    pattern: str = "",
+    max_matches: int = 200
+) -> str:
+    """
+    Fetches part of a spooled test log or collected artifact.
+
+    Args:
+        run_id (str): Run ID returned by a test run
+        name (str): Artifact name, defaults to the compressed test log
+        mode (str): 'tail', 'range', 'grep' or 'list'
+        lines (int): Number of lines for 'tail', capped at MAX_TAIL_LINES
+        offset (int): Start byte (uncompressed) for 'range'
+        length (int): Number of bytes for 'range', capped at 1 MiB
+        pattern (str): Regular expression for 'grep'
+        max_matches (int): Maximum number of lines returned by 'grep', capped at MAX_GREP_MATCHES
+
+    Returns:
+        str: Requested content or error message starting with ❌.
+    """
+    try:
+        mode = mode.lower()
+        if mode == "list":
+            entries = list_artifacts(_run_dir(run_id))
+            return "\n".join(f"{n} ({size} bytes)" for n, size in entries)
+
+        path = _resolve(run_id, name)
+        if mode == "tail":
+            return tail_lines(path, lines)
+        if mode == "range":
+            return read_range(path, offset, length)
+        if mode == "grep":
+            if not pattern:
+                return "❌ 'grep' mode needs a pattern."
+            return grep_lines(path, pattern, max_matches) or f"No lines matching '{pattern}'."
+        return f"❌ Unknown mode: {mode} (use tail, range, grep or list)"
+
+    except Exception as e:
+        return f"❌ Error reading artifact: {str(e)}"
@@ -1,8 +1,35 @@
 from mcp_config import mcp
 from datetime import datetime, timedelta
 import boto3
+from botocore.exceptions import ClientError
 import time
+import re
 from typing import List, Optional
+import os
+import controllers.artifacts as artifacts
+import controllers.history as history
+
+# With a bucket set, SSM writes the full stdout/stderr to S3 and we stream it into
+# the run's spool; otherwise only the inline output (cut at 24,000 chars) is kept
+def _ssm_output_location() -> tuple:
+    return os.environ.get("MCP_SSM_OUTPUT_BUCKET", ""), os.environ.get("MCP_SSM_OUTPUT_PREFIX", "mcp-ssm-output")
+
+SPOT_MARKET_OPTIONS = {
+    "MarketType": "spot",
+    "SpotOptions": {
+        "SpotInstanceType": "one-time",
+        "InstanceInterruptionBehavior": "terminate"
+    }
+}
+
+# run_instances errors that mean "no spot capacity right now" rather than a bad request
+SPOT_FALLBACK_ERRORS = {
+    "InsufficientInstanceCapacity",
+    "SpotMaxPriceTooLow",
+    "MaxSpotInstanceCountExceeded",
+    "UnfulfillableCapacity",
+    "CapacityNotAvailable",
+}
 
 @mcp.tool()
 def launch_test_runner(
@@ -11,7 +38,9 @@ def launch_test_runner(
     instance_type: str = "t3.micro",
     max_count: int = 1,
     region_name: str = "us-east-1",
-    security_group_ids: Optional[List[str]] = None
+    security_group_ids: Optional[List[str]] = None,
+    market: str = "on-demand",
+    availability_zone: str = ""
 ) -> dict:
     """
     MCP tool to launch a test runner EC2 instance using an AMI.
@@ -23,7 +52,9 @@ def launch_test_runner(
         instance_type=instance_type,
         max_count=max_count,
         region_name=region_name,
-        security_group_ids=security_group_ids
+        security_group_ids=security_group_ids,
+        market=market,
+        availability_zone=availability_zone
     )
 
 
@@ -33,15 +64,20 @@ def launch_ec2_with_ami(
     instance_type: str = "t3.micro",
     max_count: int = 1,
     region_name: str = "us-east-1",
-    security_group_ids: list[str] = None
+    security_group_ids: list[str] = None,
+    market: str = "on-demand",
+    availability_zone: str = ""
 ) -> dict:
     """
     Launches an EC2 instance with SSM-enabled IAM role.
+
+    With market="spot" a one-time spot instance is requested first and the
+    launch falls back to on-demand when spot capacity is not available.
     """
     try:
         ec2 = boto3.client("ec2", region_name=region_name)
 
-        response = ec2.run_instances(
+        params = dict(
             ImageId=ami_id,
             InstanceType=instance_type,
             MinCount=1,
@@ -54,6 +90,22 @@ def launch_ec2_with_ami(
                 "Tags": [{"Key": "Name", "Value": "MCP-Test-Runner"}]
             }]
         )
+        if availability_zone:
+            params["Placement"] = {"AvailabilityZone": availability_zone}
+
+        if market == "spot":
+            try:
+                response = ec2.run_instances(InstanceMarketOptions=SPOT_MARKET_OPTIONS, **params)
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in SPOT_FALLBACK_ERRORS:
+                    raise
+                print(f"⚠️ No spot capacity for {instance_type} ({e.response['Error']['Code']}), falling back to on-demand...")
+                market = "on-demand"
+                params.pop("Placement", None)
+                response = ec2.run_instances(**params)
+        else:
+            market = "on-demand"
+            response = ec2.run_instances(**params)
 
         instance = response["Instances"][0]
         instance_id = instance["InstanceId"]
@@ -66,6 +118,8 @@ def launch_ec2_with_ami(
         return {
             "instance_id": instance_id,
             "public_ip": ec2_instance.public_ip_address,
+            "instance_type": instance_type,
+            "market": market,
             "status": "ready"
         }
 
@@ -73,19 +127,39 @@ def launch_ec2_with_ami(
         return {"error": str(e)}
 
 
-def run_selenium_test_on_aws(instance_id: str, repo_url: str) -> str:
+@mcp.tool()
+def run_tests_on_instance(instance_id: str, repo_url: str, ref: str = "") -> str:
+    """
+    MCP tool to run a repo's tests on an already running EC2 runner.
+    The runner's workspace is synced incrementally and the instance is not terminated.
+    """
+    return run_selenium_test_on_aws(instance_id=instance_id, repo_url=repo_url, ref=ref)
+
+
+def run_selenium_test_on_aws(instance_id: str, repo_url: str, ref: str = "") -> str:
    
     """
     Run Selenium Test on Aws EC2 Instance.
 
+    The runner workspace is kept between runs: an existing clone of the same repo
+    is updated with git fetch + hard reset, and a fresh clone is only made when the
+    workspace is missing or broken. A ref that cannot be fetched fails the run.
+
     Args:
         instance_id : The ID of the EC2 instance to run the tests on.
         repo_url : The URL of the GitHub repository containing the tests.
+        ref : Commit SHA, branch or tag to test. Defaults to the remote HEAD.
 
     Returns:
         str: Status message or test result.
 
     """
+    # Both end up inside shell/PowerShell scripts, so only allow plain characters
+    if not re.fullmatch(r"https://github\.com/[A-Za-z0-9._/-]+", repo_url):
+        return " Only GitHub HTTPS URLs are supported."
+    target = ref or "HEAD"
+    if not re.fullmatch(r"[A-Za-z0-9._/][A-Za-z0-9._/-]*", target):
+        return f" Invalid git ref: {ref}"
     
     ec2 = boto3.client("ec2", region_name="us-east-1")
     ssm = boto3.client("ssm", region_name="us-east-1")
@@ -96,55 +170,173 @@ def run_selenium_test_on_aws(instance_id: str, repo_url: str) -> str:
 
     document = "AWS-RunPowerShellScript" if is_windows else "AWS-RunShellScript"
 
-    print(f"📦 Cloning repo {repo_url} and executing test using SSM...")
+    print(f"📦 Syncing repo {repo_url} ({target}) and executing test using SSM...")
 
     if is_windows:
         command = f"""
         $log = "C:\\mcp-log.txt"
-        "=== MCP Windows Test Run ===" | Out-File -FilePath $log
+        "=== MCP Windows Test Run ===" | Tee-Object -FilePath $log
 
         try {{
-            "Using preinstalled Git at C:\\Program Files\\Git\\bin\\git.exe" | Out-File -Append $log
+            "Using preinstalled Git at C:\\Program Files\\Git\\bin\\git.exe" | Tee-Object -FilePath $log -Append
             $gitPath = "C:\\Program Files\\Git\\bin\\git.exe"
 
-            # Clean old repo if it exists
-            if (Test-Path "C:\\repo") {{
-                "⚠️ Repo already exists. Deleting..." | Out-File -FilePath $log -Append
-                Remove-Item "C:\\repo" -Recurse -Force
+            $repoDir = "C:\\repo"
+            $target = "{target}"
+
+            # Sets $script:synced; pipeline output would mix into a return value
+            function Sync-Workspace {{
+                $script:synced = $false
+                & "$gitPath" -C $repoDir fetch --prune origin $target 2>&1 | Tee-Object -FilePath $log -Append
+                if ($LASTEXITCODE -ne 0) {{ "❌ Could not fetch $target" | Tee-Object -FilePath $log -Append; return }}
+                & "$gitPath" -C $repoDir reset --hard FETCH_HEAD 2>&1 | Tee-Object -FilePath $log -Append
+                if ($LASTEXITCODE -ne 0) {{ "❌ Could not check out $target" | Tee-Object -FilePath $log -Append; return }}
+                $script:synced = $true
+            }}
+
+            function New-Workspace {{
+                if (Test-Path $repoDir) {{ Remove-Item $repoDir -Recurse -Force }}
+                " Cloning repository..." | Tee-Object -FilePath $log -Append
+                & "$gitPath" clone {repo_url} $repoDir 2>&1 | Tee-Object -FilePath $log -Append
+                if ($LASTEXITCODE -ne 0) {{ "❌ git clone failed" | Tee-Object -FilePath $log -Append; exit 1 }}
+            }}
+
+            # Cheap checks only, so setup time does not grow with the repo's history
+            $usable = $false
+            if (Test-Path "$repoDir\\.git") {{
+                & "$gitPath" -C $repoDir rev-parse --verify --quiet HEAD *> $null
+                if ($LASTEXITCODE -eq 0) {{
+                    & "$gitPath" -C $repoDir cat-file -e "HEAD^{{tree}}" *> $null
+                    if ($LASTEXITCODE -eq 0) {{
+                        $origin = & "$gitPath" -C $repoDir config --get remote.origin.url
+                        $usable = ($LASTEXITCODE -eq 0 -and $origin -eq "{repo_url}")
+                    }}
+                }}
+            }}
+
+            # Fresh clone only when the workspace is missing or broken
+            if (-not $usable) {{
+                if (Test-Path $repoDir) {{ "⚠️ Workspace unusable. Deleting..." | Tee-Object -FilePath $log -Append }}
+                New-Workspace
             }}
 
-            # Clone fresh
-            " Cloning repository..." | Out-File -Append $log
-            & "$gitPath" clone {repo_url} C:\\repo 2>&1 | Out-File -Append $log
-            Set-Location C:\\repo
+            " Syncing workspace to $target..." | Tee-Object -FilePath $log -Append
+            Sync-Workspace
+            if (-not $script:synced) {{
+                # Only a corrupt reused workspace is re-cloned; a bad ref fails the run
+                if (-not $usable) {{ exit 1 }}
+                & "$gitPath" -C $repoDir fsck --connectivity-only --no-progress *> $null
+                if ($LASTEXITCODE -eq 0) {{ exit 1 }}
+                "⚠️ Workspace is corrupt. Cloning fresh..." | Tee-Object -FilePath $log -Append
+                New-Workspace
+                Sync-Workspace
+                if (-not $script:synced) {{ exit 1 }}
+            }}
+            # Ignored build outputs and dependency dirs are kept
+            & "$gitPath" -C $repoDir clean -fd -e target -e node_modules -e build -e .gradle 2>&1 | Tee-Object -FilePath $log -Append
+
+            Set-Location $repoDir
+            " Workspace at commit: $(& "$gitPath" rev-parse HEAD)" | Tee-Object -FilePath $log -Append
             
             $MavenPath = "C:\\apache-maven-3.9.10\\bin\\mvn.cmd"
 
+            # Sample whole-instance memory while the suite runs, for runner sizing
+            $peakFile = "C:\\mcp-mem-peak.txt"
+            Remove-Item $peakFile -ErrorAction SilentlyContinue
+            $sampler = Start-Job -ArgumentList $peakFile {{
+                param($peakFile)
+                $peak = 0
+                while ($true) {{
+                    $os = Get-CimInstance Win32_OperatingSystem
+                    $used = [int](($os.TotalVisibleMemorySize - $os.FreePhysicalMemory) / 1024)
+                    if ($used -gt $peak) {{ $peak = $used; Set-Content -Path $peakFile -Value $peak }}
+                    Start-Sleep -Seconds 2
+                }}
+            }}
+            $started = Get-Date
+
            if (Test-Path 'testng.xml') {{
-                " Running mvn with testng.xml..." | Out-File -Append $log
+                " Running mvn with testng.xml..." | Tee-Object -FilePath $log -Append
                  $arguments = @("test", "-DsuiteXmlFile=testng.xml")
-                 & "$MavenPath" @arguments | Out-File -Append $log
+                 & "$MavenPath" @arguments | Tee-Object -FilePath $log -Append
             }} elseif (Test-Path 'pom.xml') {{
-                " Running Maven test..." | Out-File -Append $log
-                & "$MavenPath" test | Out-File -Append $log
+                " Running Maven test..." | Tee-Object -FilePath $log -Append
+                & "$MavenPath" test | Tee-Object -FilePath $log -Append
             }} else {{
-                " No test config found. Files:" | Out-File -Append $log
-                  Get-ChildItem -Recurse | Out-File -Append $log
+                " No test config found. Files:" | Tee-Object -FilePath $log -Append
+                  Get-ChildItem -Recurse | Tee-Object -FilePath $log -Append
             }}
 
+            Stop-Job $sampler; Remove-Job $sampler -Force
+            $peakMem = if (Test-Path $peakFile) {{ Get-Content $peakFile }} else {{ 0 }}
+            "MCP_USAGE peak_mem_mb=$peakMem cpu_s=0 duration_s=$([int]((Get-Date) - $started).TotalSeconds)" | Tee-Object -FilePath $log -Append
+
         }} catch {{
-            $_ | Out-File -Append $log
+            $_ | Tee-Object -FilePath $log -Append
         }}
-        
-        Get-Content $log
         """
     else:
         command = f"""
-        mkdir -p /home/ec2-user/repo &&
+        mkdir -p /home/ec2-user &&
         cd /home/ec2-user &&
-        yum install -y git || apt-get install -y git &&
-        git clone {repo_url} repo &&
-        cd repo &&
+        (command -v git >/dev/null 2>&1 || yum install -y git || apt-get install -y git)
+
+        sync_workspace() {{
+            git -C repo fetch --prune origin {target} || {{ echo "❌ Could not fetch {target}"; return 1; }}
+            git -C repo reset --hard FETCH_HEAD || {{ echo "❌ Could not check out {target}"; return 1; }}
+        }}
+        new_workspace() {{
+            rm -rf repo
+            git clone {repo_url} repo || {{ echo "❌ git clone failed"; exit 1; }}
+        }}
+
+        # Cheap checks only, so setup time does not grow with the repo's history
+        usable=no
+        if [ -d repo/.git ] &&
+           git -C repo rev-parse --verify --quiet HEAD >/dev/null 2>&1 &&
+           git -C repo cat-file -e 'HEAD^{{tree}}' 2>/dev/null &&
+           [ "$(git -C repo config --get remote.origin.url)" = "{repo_url}" ]; then
+            usable=yes
+        fi
+
+        # Fresh clone only when the workspace is missing or broken
+        if [ "$usable" = no ]; then
+            echo "Workspace missing or unusable. Cloning fresh..."
+            new_workspace
+        fi
+
+        echo "Syncing workspace to {target}..."
+        if ! sync_workspace; then
+            # Only a corrupt reused workspace is re-cloned; a bad ref fails the run
+            if [ "$usable" = no ] || git -C repo fsck --connectivity-only --no-progress >/dev/null 2>&1; then
+                exit 1
+            fi
+            echo "⚠️ Workspace is corrupt. Cloning fresh..."
+            new_workspace
+            sync_workspace || exit 1
+        fi
+        # Ignored build outputs and dependency dirs are kept
+        git -C repo clean -fd -e target -e node_modules -e build -e .gradle
+
+        cd repo || exit 1
+        echo "Workspace at commit: $(git rev-parse HEAD)"
+
+        # Sample whole-instance memory and CPU while the suite runs, for runner sizing
+        peak_file=$(mktemp)
+        echo 0 > "$peak_file"
+        (
+            peak=0
+            while :; do
+                used=$(awk '/^MemTotal/{{t=$2}} /^MemAvailable/{{a=$2}} END{{print int((t-a)/1024)}}' /proc/meminfo)
+                if [ "$used" -gt "$peak" ]; then peak=$used; echo "$peak" > "$peak_file"; fi
+                sleep 2
+            done
+        ) &
+        sampler=$!
+        cpu_busy() {{ awk '/^cpu /{{print $2+$3+$4+$7+$8}}' /proc/stat; }}
+        cpu_start=$(cpu_busy)
+        started=$(date +%s)
+
         if [ -f testng.xml ]; then
             mvn test -DsuiteXmlFile=testng.xml
         elif [ -f pom.xml ]; then
@@ -157,13 +349,24 @@ def run_selenium_test_on_aws(instance_id: str, repo_url: str) -> str:
              echo "No recognizable test config."
         ls -la
         fi
+        status=$?
+
+        kill "$sampler" 2>/dev/null
+        echo "MCP_USAGE peak_mem_mb=$(cat "$peak_file") cpu_s=$(( ($(cpu_busy) - cpu_start) / $(getconf CLK_TCK) )) duration_s=$(( $(date +%s) - started ))"
+        exit $status
         """
 
     try:
+        bucket, prefix = _ssm_output_location()
+        output_params = {}
+        if bucket:
+            output_params = {"OutputS3BucketName": bucket, "OutputS3KeyPrefix": prefix}
+
         send_response = ssm.send_command(
             InstanceIds=[instance_id],
             DocumentName=document,
             Parameters={"commands": [command]},
+            **output_params
         )
 
         command_id = send_response["Command"]["CommandId"]
@@ -174,9 +377,23 @@ def run_selenium_test_on_aws(instance_id: str, repo_url: str) -> str:
                 InstanceId=instance_id
             )
             if result["Status"] in ["Success", "Failed", "Cancelled", "TimedOut"]:
+                # Spool to disk and only hand back the tails
+                run_id, run_dir = artifacts.new_run()
+                note = ""
+                try:
+                    if bucket:
+                        spool_ssm_output(command_id, instance_id, run_dir)
+                    else:
+                        artifacts.spool_text(result.get("StandardOutputContent", ""), run_dir)
+                        artifacts.spool_text(result.get("StandardErrorContent", ""), run_dir, "stderr.log.gz")
+                        note = "\n⚠️ Inline SSM output is cut at 24,000 chars; set MCP_SSM_OUTPUT_BUCKET for full logs."
+                finally:
+                    artifacts.finish_run(run_dir)
+                history.record_usage(repo_url, parse_usage(os.path.join(run_dir, artifacts.LOG_NAME)), source="ec2")
                 return (
-                    f" Test Output:\n{result.get('StandardOutputContent', '')}\n\n"
-                    f" Errors:\n{result.get('StandardErrorContent', '')}"
+                    f" Test Output:\n{artifacts.tail_lines(os.path.join(run_dir, artifacts.LOG_NAME))}\n\n"
+                    f" Errors:\n{artifacts.tail_lines(os.path.join(run_dir, 'stderr.log.gz'))}\n\n"
+                    f"{artifacts.run_summary(run_id)}{note}"
                 )
             time.sleep(5)
 
@@ -185,6 +402,54 @@ def run_selenium_test_on_aws(instance_id: str, repo_url: str) -> str:
     except Exception as e:
         return f" Failed to run test via SSM: {str(e)}"
 
+def parse_usage(log_path: str) -> dict:
+    """
+    Reads the MCP_USAGE line the runner script prints after the suite.
+    """
+    lines = artifacts.grep_lines(log_path, r"^MCP_USAGE ").splitlines()
+    if not lines:
+        return {}
+    return {key: float(value) for key, value in re.findall(r"(\w+)=([\d.]+)", lines[-1])}
+
+def spool_ssm_output(command_id: str, instance_id: str, run_dir: str, region_name: str = "us-east-1") -> None:
+    """
+    Streams the stdout/stderr objects SSM wrote to S3 into the run's spool files.
+    """
+    bucket, prefix = _ssm_output_location()
+    s3 = boto3.client("s3", region_name=region_name)
+    names = {"stdout": artifacts.LOG_NAME, "stderr": "stderr.log.gz"}
+    found = set()
+
+    # Keys look like <prefix>/<command>/<instance>/<plugin>/<step>/stdout
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/{command_id}/{instance_id}/"):
+        for obj in page.get("Contents", []):
+            stream = obj["Key"].rsplit("/", 1)[-1]
+            if stream in names and stream not in found:
+                body = s3.get_object(Bucket=bucket, Key=obj["Key"])["Body"]
+                artifacts.spool_stream(body, run_dir, names[stream])
+                found.add(stream)
+
+    # SSM skips uploading empty streams
+    for stream, name in names.items():
+        if stream not in found:
+            artifacts.spool_text("", run_dir, name)
+
+def was_spot_interrupted(instance_id: str, region_name: str = "us-east-1") -> bool:
+    """
+    Checks whether a spot instance was reclaimed by AWS.
+    """
+    try:
+        ec2 = boto3.client("ec2", region_name=region_name)
+        instance = ec2.describe_instances(InstanceIds=[instance_id])["Reservations"][0]["Instances"][0]
+        if instance.get("InstanceLifecycle") != "spot":
+            return False
+        reason = instance.get("StateReason", {}).get("Code", "")
+        return reason == "Server.SpotInstanceTermination" or instance["State"]["Name"] != "running"
+    except Exception as e:
+        print(f"[WARN] Could not check spot state of {instance_id}: {str(e)}")
+        return False
+
 @mcp.tool()
 def terminate_instance(instance_id: str) -> str:
     return terminate_ec2_instance(instance_id)
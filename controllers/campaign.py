@@ -0,0 +1,151 @@
+from mcp_config import mcp
+from fastmcp import Context
+import asyncio, re, shutil
+from typing import List
+import controllers.git as git
+import controllers.selenium as selenium
+import controllers.artifacts as artifacts
+
+
+def _parse_entry(entry: str) -> tuple:
+    # "https://github.com/org/repo#ref" -> (url, ref)
+    repo_url, _, ref = entry.partition("#")
+    return repo_url.strip(), ref.strip()
+
+
+async def _run_repo(entry: str, stages: dict) -> dict:
+    """
+    Takes one repo through clone -> tool resolution and dependency download ->
+    tests, holding each stage's slot only while that stage runs.
+    """
+    repo_url, ref = _parse_entry(entry)
+    result = {"repo": repo_url, "ref": ref or "HEAD", "ok": False, "stage": "clone"}
+
+    # Caps how many clones are on disk at once, whichever stage they are waiting for
+    async with stages["in_flight"]:
+        async with stages["clone"]:
+            repo_path = await asyncio.to_thread(git.clone_repo_fn, repo_url, ref)
+        if "❌" in repo_path:
+            return {**result, "output": repo_path}
+
+        run = None
+        try:
+            result["stage"] = "deps"
+            async with stages["deps"]:
+                test_cmd, error = await asyncio.to_thread(selenium.resolve_test_command, repo_path)
+                if not error:
+                    run = await asyncio.to_thread(artifacts.new_run)
+                    error = await asyncio.to_thread(selenium.fetch_dependencies, repo_path, test_cmd, run)
+            if error:
+                return {**result, "output": error}
+
+            result["stage"] = "test"
+            async with stages["test"]:
+                output = await asyncio.to_thread(selenium.execute_tests, repo_path, test_cmd, repo_url, run)
+            return {**result, "ok": output.startswith(" Test run succeeded"), "output": output}
+
+        except Exception as e:
+            return {**result, "output": f" Error running tests: {str(e)}"}
+
+        finally:
+            # Logs and artifacts are already spooled, the clone is no longer needed
+            await asyncio.to_thread(shutil.rmtree, repo_path, True)
+            if run:
+                artifacts.finish_run(run[1])
+
+
+def _format_result(result: dict) -> str:
+    icon = "✅" if result["ok"] else "❌"
+    first_line = result["output"].strip().splitlines()[0] if result["output"].strip() else ""
+    line = f"{icon} {result['repo']} ({result['ref']}) [{result['stage']}]: {first_line}"
+    run_id = re.search(r"Run ID: (\w+)", result["output"])
+    if run_id:
+        line += f" — run {run_id.group(1)}"
+    return line
+
+
+async def run_campaign_fn(
+    repos: List[str],
+    clone_concurrency: int = 4,
+    deps_concurrency: int = 2,
+    test_concurrency: int = 2,
+    max_in_flight: int = 0,
+    on_result=None
+) -> str:
+    """
+    Runs the test pipeline for many repos with a separate concurrency limit per stage,
+    so network-bound clones overlap with CPU/grid-bound test runs.
+
+    Args:
+        repos (List[str]): GitHub repo URLs, optionally suffixed with '#<ref>'
+        clone_concurrency (int): Max parallel clones
+        deps_concurrency (int): Max parallel tool resolutions and dependency downloads
+        test_concurrency (int): Max parallel test runs
+        max_in_flight (int): Max repos cloned but not yet finished; defaults to
+            the sum of the stage limits
+        on_result: Optional async callback(result, finished, total) called as each repo finishes
+
+    Returns:
+        str: One summary line per repo, in completion order.
+    """
+    if not repos:
+        return "❌ No repos given."
+
+    limits = {
+        "clone": max(1, clone_concurrency),
+        "deps": max(1, deps_concurrency),
+        "test": max(1, test_concurrency),
+    }
+    limits["in_flight"] = max(1, max_in_flight) if max_in_flight > 0 else sum(limits.values())
+    stages = {stage: asyncio.Semaphore(limit) for stage, limit in limits.items()}
+    tasks = [asyncio.create_task(_run_repo(entry, stages)) for entry in repos]
+
+    results = []
+    for finished in asyncio.as_completed(tasks):
+        result = await finished
+        results.append(result)
+        if on_result:
+            await on_result(result, len(results), len(tasks))
+
+    passed = sum(r["ok"] for r in results)
+    lines = [_format_result(r) for r in results]
+    return f"🏁 Campaign finished: {passed}/{len(results)} passed\n" + "\n".join(lines)
+
+
+@mcp.tool()
+async def run_campaign(
+    repos: List[str],
+    clone_concurrency: int = 4,
+    deps_concurrency: int = 2,
+    test_concurrency: int = 2,
+    max_in_flight: int = 0,
+    ctx: Context = None
+) -> str:
+    """
+    Clones and tests many repos as a staged pipeline, streaming each repo's
+    result as it finishes.
+
+    Args:
+        repos (List[str]): GitHub repo URLs, optionally suffixed with '#<ref>'
+        clone_concurrency (int): Max parallel clones
+        deps_concurrency (int): Max parallel tool resolutions and dependency downloads
+        test_concurrency (int): Max parallel test runs
+        max_in_flight (int): Max repos on disk at once (0 = sum of the stage limits)
+
+    Returns:
+        str: Campaign summary with the run ID of each repo's spooled log.
+    """
+    async def stream(result, finished, total):
+        if ctx is None:
+            return
+        await ctx.info(f"{_format_result(result)}\n{result['output']}")
+        await ctx.report_progress(finished, total)
+
+    return await run_campaign_fn(
+        repos=repos,
+        clone_concurrency=clone_concurrency,
+        deps_concurrency=deps_concurrency,
+        test_concurrency=test_concurrency,
+        max_in_flight=max_in_flight,
+        on_result=stream
+    )
@@ -1,23 +1,27 @@
 from mcp_config import mcp
-import subprocess, os, uuid
+import subprocess, os, uuid, re, shutil
 
 @mcp.tool()
-def clone_repo(repo_url: str) -> str:
-    return clone_repo_fn(repo_url=repo_url)
+def clone_repo(repo_url: str, ref: str = "") -> str:
+    return clone_repo_fn(repo_url=repo_url, ref=ref)
 
-def clone_repo_fn(repo_url: str) -> str:
+def clone_repo_fn(repo_url: str, ref: str = "") -> str:
     """
     Clones a GitHub repository to a temporary folder.
     
     Args:
         repo_url (str): The GitHub repository URL.
+        ref (str): Optional commit SHA, branch or tag to check out.
     
     Returns:
         str: Path to the cloned repo or error message starting with ❌.
     """
+    output_dir = None
     try:
         if not repo_url.startswith("https://github.com/"):
             return "❌ Only GitHub HTTPS URLs are supported."
+        if ref and not re.fullmatch(r"[A-Za-z0-9._/][A-Za-z0-9._/-]*", ref):
+            return f"❌ Invalid git ref: {ref}"
 
         # Create a unique directory to avoid collisions
         folder_name = f"repo_{uuid.uuid4().hex[:8]}"
@@ -33,12 +37,27 @@ def clone_repo_fn(repo_url: str) -> str:
 
         if result.returncode != 0:
             return f"❌ Git clone failed: {result.stderr.strip()}"
+
+        if ref:
+            for cmd in (["fetch", "origin", ref], ["checkout", "--force", "FETCH_HEAD"]):
+                result = subprocess.run(
+                    ["git", "-C", output_dir, *cmd],
+                    capture_output=True,
+                    text=True,
+                    timeout=60
+                )
+                if result.returncode != 0:
+                    shutil.rmtree(output_dir, ignore_errors=True)
+                    return f"❌ Git checkout of {ref} failed: {result.stderr.strip()}"
         
         print(f"📦 Repo Cloned at {output_dir}.")
 
         return output_dir  # ✅ return actual path
     
     except Exception as e:
+        # Don't leave a half-made clone behind (e.g. after a timeout)
+        if output_dir:
+            shutil.rmtree(output_dir, ignore_errors=True)
         return f"❌ Error: {str(e)}"
     
 
@@ -0,0 +1,77 @@
+import os, json, math
+import threading
+from datetime import datetime, timezone
+
+HISTORY_SAMPLES = 10
+MEMORY_HEADROOM = 1.25
+
+# Needs assumed for a suite we have never run
+DEFAULT_NEEDS = {"memory_mb": 768, "vcpus": 1}
+
+_history_lock = threading.Lock()
+
+
+def state_dir() -> str:
+    return os.environ.get("MCP_STATE_DIR", os.path.expanduser("~/.mcp"))
+
+
+def history_path() -> str:
+    return os.environ.get("MCP_SUITE_HISTORY", os.path.join(state_dir(), "suite_history.json"))
+
+
+def read_json(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_json(path: str, data: dict) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def record_usage(suite: str, usage: dict, source: str = "local") -> None:
+    """
+    Stores the resource usage of a test run so later placements can size runners.
+
+    Args:
+        suite (str): Suite key (repo URL)
+        usage (dict): peak_mem_mb, cpu_s and duration_s of the run
+        source (str): 'ec2' for runs on a runner, 'local' for runs on this host
+    """
+    if not suite or not usage:
+        return
+    sample = {
+        "peak_mem_mb": round(usage.get("peak_mem_mb", 0.0), 1),
+        "cpu_s": round(usage.get("cpu_s", 0.0), 1),
+        "duration_s": round(usage.get("duration_s", 0.0), 1),
+        "source": source,
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with _history_lock:
+        path = history_path()
+        history = read_json(path)
+        history[suite] = (history.get(suite, []) + [sample])[-HISTORY_SAMPLES:]
+        write_json(path, history)
+
+
+def suite_needs(suite: str) -> dict:
+    """
+    Memory and vCPUs a suite needs, based on its recent runs. Runs on EC2
+    runners win over runs on this host, which may be sized nothing like a runner.
+    """
+    samples = read_json(history_path()).get(suite, []) if suite else []
+    samples = [s for s in samples if s.get("peak_mem_mb")]
+    samples = [s for s in samples if s.get("source") == "ec2"] or samples
+    if not samples:
+        return dict(DEFAULT_NEEDS)
+
+    memory_mb = max(s["peak_mem_mb"] for s in samples) * MEMORY_HEADROOM
+    # Average cores kept busy during the run
+    cores = max((s["cpu_s"] / s["duration_s"] for s in samples if s.get("duration_s")), default=1)
+    return {"memory_mb": max(memory_mb, DEFAULT_NEEDS["memory_mb"]), "vcpus": max(1, math.ceil(cores))}
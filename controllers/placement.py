@@ -0,0 +1,202 @@
+from mcp_config import mcp
+import boto3
+import os, time
+import threading
+from datetime import datetime, timezone
+import controllers.aws as aws
+import controllers.history as history
+
+DEFAULT_REGION = "us-east-1"
+PRICE_TTL_SECONDS = 3600
+MAX_ATTEMPTS = 2
+
+# Candidate runner types with hourly on-demand list prices (us-east-1), used
+# when the price cache has no on-demand entry for a type
+INSTANCE_SPECS = {
+    "t3.micro":  {"vcpus": 2, "memory_mb": 1024,  "on_demand": {"Linux/UNIX": 0.0104, "Windows": 0.0196}},
+    "t3.small":  {"vcpus": 2, "memory_mb": 2048,  "on_demand": {"Linux/UNIX": 0.0208, "Windows": 0.0392}},
+    "t3.medium": {"vcpus": 2, "memory_mb": 4096,  "on_demand": {"Linux/UNIX": 0.0416, "Windows": 0.0600}},
+    "t3.large":  {"vcpus": 2, "memory_mb": 8192,  "on_demand": {"Linux/UNIX": 0.0832, "Windows": 0.1108}},
+    "c5.large":  {"vcpus": 2, "memory_mb": 4096,  "on_demand": {"Linux/UNIX": 0.0850, "Windows": 0.1770}},
+    "m5.large":  {"vcpus": 2, "memory_mb": 8192,  "on_demand": {"Linux/UNIX": 0.0960, "Windows": 0.1880}},
+    "c5.xlarge": {"vcpus": 4, "memory_mb": 8192,  "on_demand": {"Linux/UNIX": 0.1700, "Windows": 0.3540}},
+    "m5.xlarge": {"vcpus": 4, "memory_mb": 16384, "on_demand": {"Linux/UNIX": 0.1920, "Windows": 0.3760}},
+}
+
+_price_lock = threading.Lock()
+
+
+def price_cache_path() -> str:
+    return os.environ.get("MCP_PRICE_CACHE", os.path.join(history.state_dir(), "prices.json"))
+
+
+def refresh_price_table(region_name: str, product: str) -> dict:
+    """
+    Fetches current spot prices per AZ for the candidate types.
+    """
+    table = {
+        "fetched_at": time.time(),
+        "on_demand": {t: spec["on_demand"][product] for t, spec in INSTANCE_SPECS.items()},
+        "spot": {},
+    }
+    ec2 = boto3.client("ec2", region_name=region_name)
+    paginator = ec2.get_paginator("describe_spot_price_history")
+    pages = paginator.paginate(
+        InstanceTypes=list(INSTANCE_SPECS),
+        ProductDescriptions=[product],
+        StartTime=datetime.now(timezone.utc),
+    )
+    for page in pages:
+        for entry in page["SpotPriceHistory"]:
+            zones = table["spot"].setdefault(entry["InstanceType"], {})
+            # History is newest first, keep the latest price per AZ
+            zones.setdefault(entry["AvailabilityZone"], float(entry["SpotPrice"]))
+    return table
+
+
+def load_price_table(region_name: str = DEFAULT_REGION, product: str = "Linux/UNIX") -> dict:
+    """
+    Returns the cached price table, refreshing it when older than PRICE_TTL_SECONDS.
+    """
+    key = f"{region_name}/{product}"
+    path = price_cache_path()
+    with _price_lock:
+        entry = history.read_json(path).get(key)
+    if entry and time.time() - entry.get("fetched_at", 0) < PRICE_TTL_SECONDS:
+        return entry
+
+    # Fetch without holding the lock; concurrent refreshes just write the same data
+    try:
+        fresh = refresh_price_table(region_name, product)
+    except Exception as e:
+        print(f"[WARN] Could not refresh spot prices: {str(e)}")
+        # A stale table beats none; without any, price on-demand only
+        return entry or {"fetched_at": 0, "on_demand": {}, "spot": {}}
+
+    with _price_lock:
+        cache = history.read_json(path)
+        cache[key] = fresh
+        history.write_json(path, cache)
+    return fresh
+
+
+def _product_for_ami(ami_id: str, region_name: str) -> str:
+    if not ami_id:
+        return "Linux/UNIX"
+    try:
+        ec2 = boto3.client("ec2", region_name=region_name)
+        image = ec2.describe_images(ImageIds=[ami_id])["Images"][0]
+        return "Windows" if image.get("Platform", "").lower() == "windows" else "Linux/UNIX"
+    except Exception:
+        return "Linux/UNIX"
+
+
+def choose_placement(
+    suite: str = "",
+    ami_id: str = "",
+    region_name: str = DEFAULT_REGION,
+    allow_spot: bool = True
+) -> dict:
+    """
+    Picks the cheapest instance type, AZ and market that fit the suite.
+
+    Args:
+        suite (str): Suite key (repo URL) used to look up historical usage
+        ami_id (str): AMI to launch, used to price Linux vs Windows
+        region_name (str): AWS region
+        allow_spot (bool): If False, only on-demand is considered
+
+    Returns:
+        dict: instance_type, availability_zone, market, hourly_price and needs
+    """
+    needs = history.suite_needs(suite)
+    product = _product_for_ami(ami_id, region_name)
+    table = load_price_table(region_name, product)
+
+    options = []
+    for instance_type, spec in INSTANCE_SPECS.items():
+        if spec["memory_mb"] < needs["memory_mb"] or spec["vcpus"] < needs["vcpus"]:
+            continue
+        on_demand = table.get("on_demand", {}).get(instance_type, spec["on_demand"][product])
+        options.append((on_demand, instance_type, "", "on-demand"))
+        if allow_spot:
+            for zone, price in table.get("spot", {}).get(instance_type, {}).items():
+                options.append((price, instance_type, zone, "spot"))
+
+    if not options:
+        # Nothing is big enough; take the largest candidate on-demand
+        instance_type = max(INSTANCE_SPECS, key=lambda t: INSTANCE_SPECS[t]["memory_mb"])
+        options.append((INSTANCE_SPECS[instance_type]["on_demand"][product], instance_type, "", "on-demand"))
+
+    price, instance_type, zone, market = min(options)
+    return {
+        "instance_type": instance_type,
+        "availability_zone": zone,
+        "market": market,
+        "hourly_price": price,
+        "needs": needs,
+    }
+
+
+@mcp.tool()
+def get_runner_placement(repo_url: str = "", ami_id: str = "", allow_spot: bool = True) -> dict:
+    """
+    MCP tool to preview where a test runner for a repo would be launched.
+    """
+    return choose_placement(suite=repo_url, ami_id=ami_id, allow_spot=allow_spot)
+
+
+def run_on_placed_runner(
+    repo_url: str,
+    ami_id: str,
+    key_name: str,
+    ref: str = "",
+    security_group_ids: list = None
+) -> str:
+    """
+    Launches a placed runner, runs the suite over SSM and terminates the runner.
+    Work interrupted by a spot reclaim is re-queued on on-demand capacity.
+
+    Returns:
+        str: Test result or error message.
+    """
+    placement = choose_placement(suite=repo_url, ami_id=ami_id)
+    market = placement["market"]
+    print(
+        f"📍 Placement: {placement['instance_type']} {market} "
+        f"{placement['availability_zone'] or DEFAULT_REGION} @ ${placement['hourly_price']:.4f}/h"
+    )
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        result = aws.launch_ec2_with_ami(
+            ami_id=ami_id,
+            key_name=key_name,
+            instance_type=placement["instance_type"],
+            max_count=1,
+            region_name=DEFAULT_REGION,
+            security_group_ids=security_group_ids,
+            market=market,
+            availability_zone=placement["availability_zone"] if market == "spot" else ""
+        )
+
+        if "error" in result:
+            return result["error"]
+
+        instance_id = result["instance_id"]
+        print(f"✅ EC2 instance launched: {instance_id} ({result['instance_type']}, {result['market']})")
+
+        ready = aws.wait_for_ssm_ready(instance_id=instance_id)
+        test_output = aws.run_selenium_test_on_aws(instance_id=instance_id, repo_url=repo_url, ref=ref) if ready else ""
+        interrupted = result["market"] == "spot" and aws.was_spot_interrupted(instance_id)
+        aws.terminate_ec2_instance(instance_id=instance_id)
+
+        if interrupted:
+            print(f"⚠️ Spot instance {instance_id} was interrupted (attempt {attempt}), re-queueing on on-demand...")
+            market = "on-demand"
+            continue
+
+        if not ready:
+            return f"❌ Timeout: SSM agent not ready on EC2 instance {instance_id}"
+        return f"✅ EC2 Test Run Complete on {instance_id}:\n{test_output}"
+
+    return f"❌ Test run for {repo_url} was interrupted {MAX_ATTEMPTS} times."
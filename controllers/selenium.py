@@ -1,93 +1,218 @@
 from mcp_config import mcp
 import subprocess, os, uuid
 import platform
+import threading
+import venv
+import controllers.artifacts as artifacts
+import controllers.history as history
+
+# Serialises Maven installs when several repos resolve tools at once
+_tool_lock = threading.Lock()
+
+DEPS_LOG = "deps.log.gz"
+DEPS_TIMEOUT = 600
+
+# Python projects get their own venv inside the clone, never the server's interpreter
+VENV_DIR = ".venv"
 
 @mcp.tool()
 def run_selenium_tests(repo_path: str) -> str:
-    run_tests(repo_path=repo_path)
+    return run_tests(repo_path=repo_path)
 
-def run_tests(repo_path: str) -> str:
+def run_tests(repo_path: str, suite: str = "") -> str:
     """
     Runs Selenium tests from the specified repository.
     
     Args:
         repo_path (str): The path where the repo was cloned.
+        suite (str): Optional suite key (repo URL) to record resource usage under.
     
     Returns:
-        str: Output of the test command or error message.
+        str: Tail of the test output with the run ID of the spooled log, or error message.
     """
     try:
         if not os.path.isdir(repo_path):
             return f" Invalid repo path: {repo_path}"
 
-        # Go to the repo directory
-        os.chdir(repo_path)
-
-        # Optional: DEBUG mvn path
-        mvn_path = subprocess.run(["which", "mvn"], capture_output=True, text=True).stdout.strip()
-
-        # Step 2: Try common fallback locations
-        fallback_paths = ["/usr/local/bin/mvn", "/opt/homebrew/bin/mvn", "/usr/bin/mvn"]
-        if not mvn_path:
-            for path in fallback_paths:
-                if os.path.exists(path):
-                    mvn_path = path
-                    break
-
-        # Step 3: Try install if still not found
-        if not mvn_path:
-            system = platform.system()
-            if system == "Linux":
-                print("[DEBUG] Installing Maven via apt")
-                install_cmd = "sudo apt-get update && sudo apt-get install -y maven"
-            elif system == "Darwin":  # macOS
-                print("[DEBUG] Installing Maven via brew")
-                install_cmd = "/opt/homebrew/bin/brew install maven || brew install maven"
-            else:
-                return f" Unsupported OS: {system}"
-
-            install = subprocess.run(
-                install_cmd,
-                shell=True,
-                capture_output=True,
-                text=True
-            )
-
-            if install.returncode != 0:
-                return f" Maven installation failed:\n{install.stderr}"
-
-            # Retry which after install
+        test_cmd, error = resolve_test_command(repo_path)
+        if error:
+            return error
+
+        run = artifacts.new_run()
+        try:
+            error = fetch_dependencies(repo_path, test_cmd, run)
+            if error:
+                return error
+
+            return execute_tests(repo_path, test_cmd, suite=suite, run=run)
+        finally:
+            artifacts.finish_run(run[1])
+
+    except Exception as e:
+        return f" Error running tests: {str(e)}"
+
+def resolve_test_command(repo_path: str) -> tuple:
+    """
+    Resolves the build tool (installing Maven if needed) and the test command for a repo.
+
+    Args:
+        repo_path (str): The path where the repo was cloned.
+
+    Returns:
+        tuple: (test command, None) or (None, error message).
+    """
+    # Optional: DEBUG mvn path
+    mvn_path = subprocess.run(["which", "mvn"], capture_output=True, text=True).stdout.strip()
+
+    # Step 2: Try common fallback locations
+    fallback_paths = ["/usr/local/bin/mvn", "/opt/homebrew/bin/mvn", "/usr/bin/mvn"]
+    if not mvn_path:
+        for path in fallback_paths:
+            if os.path.exists(path):
+                mvn_path = path
+                break
+
+    # Step 3: Try install if still not found, one install at a time
+    if not mvn_path:
+        with _tool_lock:
+            # Another repo may have installed it while we waited
             mvn_path = subprocess.run(["which", "mvn"], capture_output=True, text=True).stdout.strip()
 
-        if not mvn_path:
-            return " 'mvn' not found after attempted installation."
-
-        # Determine the type of project
-        if os.path.exists("testng.xml"):
-            test_cmd = [mvn_path, "test", "-DsuiteXmlFile=testng.xml"]
-        elif os.path.exists("pom.xml"):
-            test_cmd = [mvn_path, "test"]   
-        elif os.path.exists("build.gradle"):
-            test_cmd = ["./gradlew", "test"]
-        elif os.path.exists("package.json"):
-            test_cmd = ["npm", "test"]
-        elif os.path.exists("requirements.txt"):
-            test_cmd = ["python", "-m", "pytest"]
-        else:
-            return " No recognizable test config found (pom.xml, package.json, etc.)"
-
-        # Run the test command
-        result = subprocess.run(
-            test_cmd,
-            capture_output=True,
-            text=True,
-            timeout=180
-        )
-
-        if result.returncode != 0:
-            return f" Test run failed:\n{result.stderr}"
-
-        return f" Test run succeeded:\n{result.stdout}"
+            if not mvn_path:
+                system = platform.system()
+                if system == "Linux":
+                    print("[DEBUG] Installing Maven via apt")
+                    install_cmd = "sudo apt-get update && sudo apt-get install -y maven"
+                elif system == "Darwin":  # macOS
+                    print("[DEBUG] Installing Maven via brew")
+                    install_cmd = "/opt/homebrew/bin/brew install maven || brew install maven"
+                else:
+                    return None, f" Unsupported OS: {system}"
+
+                install = subprocess.run(
+                    install_cmd,
+                    shell=True,
+                    capture_output=True,
+                    text=True
+                )
+
+                if install.returncode != 0:
+                    return None, f" Maven installation failed:\n{install.stderr}"
+
+                # Retry which after install
+                mvn_path = subprocess.run(["which", "mvn"], capture_output=True, text=True).stdout.strip()
+
+    if not mvn_path:
+        return None, " 'mvn' not found after attempted installation."
+
+    # Determine the type of project
+    def has(name):
+        return os.path.exists(os.path.join(repo_path, name))
+
+    if has("testng.xml"):
+        return [mvn_path, "test", "-DsuiteXmlFile=testng.xml"], None
+    elif has("pom.xml"):
+        return [mvn_path, "test"], None
+    elif has("build.gradle"):
+        return ["./gradlew", "test"], None
+    elif has("package.json"):
+        return ["npm", "test"], None
+    elif has("requirements.txt"):
+        return [venv_python(repo_path), "-m", "pytest"], None
+    return None, " No recognizable test config found (pom.xml, package.json, etc.)"
+
+def venv_python(repo_path: str) -> str:
+    bin_dir = "Scripts" if os.name == "nt" else "bin"
+    return os.path.join(repo_path, VENV_DIR, bin_dir, "python")
+
+def dependency_command(repo_path: str, test_cmd: list) -> list:
+    """
+    Command that downloads a project's dependencies without running its tests.
+
+    Returns:
+        list | None: Command to run, or None if the project type has no separate fetch.
+    """
+    if test_cmd[1:2] == ["test"] and os.path.exists(os.path.join(repo_path, "pom.xml")):
+        return [test_cmd[0], "-B", "dependency:go-offline"]
+    if test_cmd == ["npm", "test"]:
+        has_lock = os.path.exists(os.path.join(repo_path, "package-lock.json"))
+        return ["npm", "ci"] if has_lock else ["npm", "install"]
+    if test_cmd == [venv_python(repo_path), "-m", "pytest"]:
+        # pytest itself is often missing from requirements.txt
+        return [test_cmd[0], "-m", "pip", "install", "-r", "requirements.txt", "pytest"]
+    return None
+
+def fetch_dependencies(repo_path: str, test_cmd: list, run: tuple) -> str:
+    """
+    Downloads the project's dependencies into the repo/tool caches, spooling output
+    to the run's deps log, so the test step itself does little network I/O.
+
+    Args:
+        repo_path (str): The path where the repo was cloned.
+        test_cmd (list): Command returned by resolve_test_command().
+        run (tuple): (run_id, run_dir) from artifacts.new_run().
+
+    Returns:
+        str | None: Error message, or None when dependencies are in place.
+    """
+    deps_cmd = dependency_command(repo_path, test_cmd)
+    if not deps_cmd:
+        return None
+
+    run_id, run_dir = run
+    if deps_cmd[0] == venv_python(repo_path) and not os.path.exists(deps_cmd[0]):
+        try:
+            venv.create(os.path.join(repo_path, VENV_DIR), with_pip=True)
+        except Exception as e:
+            return f" Could not create virtualenv: {str(e)}"
+
+    returncode = artifacts.run_spooled(deps_cmd, run_dir, timeout=DEPS_TIMEOUT, cwd=repo_path, name=DEPS_LOG)
+    if returncode == 0:
+        return None
+
+    tail = artifacts.tail_lines(os.path.join(run_dir, DEPS_LOG))
+    reason = f"timed out after {DEPS_TIMEOUT}s" if returncode is None else "failed"
+    return (
+        f" Dependency fetch {reason}:\n{tail}\n\n"
+        f"📁 Run ID: {run_id} (log: get_run_artifact(run_id=\"{run_id}\", name=\"{DEPS_LOG}\"))"
+    )
+
+def execute_tests(repo_path: str, test_cmd: list, suite: str = "", run: tuple = None) -> str:
+    """
+    Runs a resolved test command in the repo, spooling output and artifacts to disk.
+
+    Args:
+        repo_path (str): The path where the repo was cloned.
+        test_cmd (list): Command returned by resolve_test_command().
+        suite (str): Optional suite key (repo URL) to record resource usage under.
+        run (tuple): Optional (run_id, run_dir) to share with the dependency step;
+            the caller finishes it. Without one, a run is created and finished here.
+
+    Returns:
+        str: Tail of the test output with the run ID of the spooled log.
+    """
+    try:
+        # Run the test command, streaming output to the run's spool directory
+        run_id, run_dir = run or artifacts.new_run()
+        try:
+            usage = {}
+            returncode = artifacts.run_spooled(test_cmd, run_dir, timeout=180, cwd=repo_path, usage=usage)
+            history.record_usage(suite, usage, source="local")
+            collected = artifacts.collect_artifacts(repo_path, run_dir)
+        finally:
+            if not run:
+                artifacts.finish_run(run_dir)
+
+        tail = artifacts.tail_lines(os.path.join(run_dir, artifacts.LOG_NAME))
+        summary = artifacts.run_summary(run_id, collected)
+
+        if returncode is None:
+            return f" Test run timed out after 180s:\n{tail}\n\n{summary}"
+
+        if returncode != 0:
+            return f" Test run failed:\n{tail}\n\n{summary}"
+
+        return f" Test run succeeded:\n{tail}\n\n{summary}"
 
     except Exception as e:
         return f" Error running tests: {str(e)}"
@@ -6,17 +6,24 @@ import controllers.git as git
 import controllers.selenium as selenium
 import controllers.aws as aws
 import controllers.grid as grid
+import controllers.artifacts as artifacts
+import controllers.placement as placement
+import controllers.campaign as campaign
 
 # Optional: add a wrapper tool to chain clone + test
 @mcp.tool()
-def clone_and_test(repo_url: str, run_on_aws: bool = False, ami_id: str = "", key_name: str = "your-key") -> str:
+def clone_and_test(repo_url: str, run_on_aws: bool = False, ami_id: str = "", key_name: str = "your-key", ref: str = "", instance_id: str = "") -> str:
 
     """
     Runs tests locally or on AWS depending on the flag.
     
     Args:
         repo_url (str): GitHub repo URL
-        run_on_aws (bool): If True, launches EC2 and runs test remotely
+        run_on_aws (bool): If True, launches a spot/on-demand EC2 runner sized from
+            the suite's past runs and runs test remotely
+        ref (str): Commit SHA, branch or tag to test on EC2 (defaults to remote HEAD)
+        instance_id (str): Existing EC2 runner to reuse; its workspace is synced
+            incrementally and the instance is left running afterwards
     
     Returns:
         str: Test result or instance details
@@ -26,33 +33,22 @@ def clone_and_test(repo_url: str, run_on_aws: bool = False, ami_id: str = "", ke
         repo_path = git.clone_repo_fn(repo_url)
         if "❌" in repo_path:
             return repo_path
-        return selenium.run_tests(repo_path)
+        return selenium.run_tests(repo_path, suite=repo_url)
+
+    if instance_id:
+        print(f"♻️ Reusing EC2 instance {instance_id}...")
+        test_output = aws.run_selenium_test_on_aws(instance_id=instance_id, repo_url=repo_url, ref=ref)
+        return f"✅ EC2 Test Run Complete on {instance_id}:\n{test_output}"
     
     print(f"🔧 Launching EC2 instance with AMI: {ami_id} and key: {key_name}...")
-    result = aws.launch_ec2_with_ami(
+    return placement.run_on_placed_runner(
+        repo_url=repo_url,
         ami_id=ami_id,
         key_name=key_name,
-        instance_type = "t3.micro",
-        max_count   = 1,
-        region_name = "us-east-1",
+        ref=ref,
         security_group_ids=["sg-0abad17ad83da200b"]
     )
 
-    if "error" in result:
-        return result["error"]
-
-    instance_id = result["instance_id"]
-    print(f"✅ EC2 instance launched: {instance_id}")
-
-    if aws.wait_for_ssm_ready(instance_id=instance_id):
-        print("✅ SSM is ready.")
-        test_output = aws.run_selenium_test_on_aws(instance_id=instance_id, repo_url=repo_url)
-        aws.terminate_ec2_instance(instance_id=instance_id)
-        return f"✅ EC2 Test Run Complete on {instance_id}:\n{test_output}"
-    else:
-        aws.terminate_ec2_instance(instance_id=instance_id)
-        return f"❌ Timeout: SSM agent not ready on EC2 instance {instance_id}"
-
 @mcp.prompt
 def prompt_run_tests(repo_url: str, run_on_aws: bool = False, ami_id: str = "", key_name: str = "your-key") -> str:
     """
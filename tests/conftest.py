@@ -0,0 +1,42 @@
+import os, sys, shutil
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    """Isolated ~/.mcp with the canned price table."""
+    monkeypatch.setenv("MCP_STATE_DIR", str(tmp_path))
+    monkeypatch.delenv("MCP_SUITE_HISTORY", raising=False)
+    cache = tmp_path / "prices.json"
+    shutil.copy(os.path.join(FIXTURES, "prices.json"), cache)
+    monkeypatch.setenv("MCP_PRICE_CACHE", str(cache))
+    return tmp_path
+
+
+@pytest.fixture
+def aws_account(monkeypatch):
+    """Mocked AWS account with the runner instance profile; yields a usable AMI ID."""
+    from moto import mock_aws
+    import boto3
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("iam").create_instance_profile(InstanceProfileName="MCP-EC2-SSM-Role")
+        ec2 = boto3.client("ec2", region_name="us-east-1")
+        yield ec2.describe_images(Owners=["amazon"])["Images"][0]["ImageId"]
+
+
+@pytest.fixture
+def run_root(tmp_path, monkeypatch):
+    """Isolated MCP_ARTIFACT_DIR for spooled runs."""
+    import controllers.artifacts as artifacts
+
+    root = tmp_path / "runs"
+    monkeypatch.setattr(artifacts, "ARTIFACT_ROOT", str(root))
+    return root
@@ -0,0 +1,152 @@
+import os, subprocess, time
+
+import controllers.artifacts as artifacts
+
+
+def test_memory_is_not_inherited_from_the_server(run_root):
+    # Touch every page so the parent's high-water mark really is this large
+    ballast = b"\x01" * (300 * 1024 * 1024)
+    _, run_dir = artifacts.new_run()
+    usage = {}
+
+    assert artifacts.run_spooled(["sleep", "1"], run_dir, usage=usage) == 0
+    assert usage["peak_mem_mb"] < 100
+    del ballast
+
+
+def test_tail_and_grep_are_clamped(run_root):
+    run_id, run_dir = artifacts.new_run()
+    text = "".join(f"line {i}\n" for i in range(5000)) + "x" * (3 * 1024 * 1024)
+    artifacts.spool_text(text, run_dir)
+
+    tail = artifacts.get_run_artifact_fn(run_id, mode="tail", lines=10**9)
+    assert len(tail.encode()) <= artifacts.MAX_RANGE_BYTES
+    assert tail.endswith("x" * 100)
+
+    grep = artifacts.get_run_artifact_fn(run_id, mode="grep", pattern="line", max_matches=10**9)
+    assert grep.splitlines()[-1] == f"... stopped after {artifacts.MAX_GREP_MATCHES} matches"
+    assert grep.splitlines()[0] == "1: line 0"
+
+
+def _age(run_dir, seconds):
+    # Backdate the run and everything in it
+    stamp = time.time() - seconds
+    for root, _, files in os.walk(run_dir):
+        for f in files:
+            os.utime(os.path.join(root, f), (stamp, stamp))
+    os.utime(run_dir, (stamp, stamp))
+
+
+def test_live_run_survives_pruning_until_finished(run_root, monkeypatch):
+    monkeypatch.setattr(artifacts, "MAX_TOTAL_MB", 0)
+    _, waiting = artifacts.new_run()
+    _age(waiting, artifacts.ACTIVE_GRACE_SECONDS * 2)
+
+    artifacts.new_run()
+    assert os.path.isdir(waiting)
+
+    artifacts.finish_run(waiting)
+    _age(waiting, artifacts.ACTIVE_GRACE_SECONDS * 2)
+    artifacts.new_run()
+    assert not os.path.exists(waiting)
+
+
+def _running(pid):
+    # Killed processes may linger as zombies until init reaps them
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_output_is_spooled_with_exit_code(run_root):
+    run_id, run_dir = artifacts.new_run()
+
+    code = artifacts.run_spooled(["sh", "-c", "echo out; echo err >&2; exit 3"], run_dir)
+
+    assert code == 3
+    assert artifacts.get_run_artifact_fn(run_id) == "out\nerr\n"
+    assert artifacts.run_spooled(["true"], run_dir, name="other.log.gz") == 0
+    assert artifacts.get_run_artifact_fn(run_id, mode="list").splitlines()[0].startswith("other.log.gz")
+
+
+def test_timeout_kills_background_grandchildren(run_root, tmp_path):
+    _, run_dir = artifacts.new_run()
+    pid_file = tmp_path / "pid"
+    started = time.time()
+
+    code = artifacts.run_spooled(
+        ["sh", "-c", f"echo start; sleep 30 & echo $! > {pid_file}; sleep 60"], run_dir, timeout=1
+    )
+
+    assert code is None
+    assert time.time() - started < 10
+    assert not _running(int(pid_file.read_text()))
+    # The gzip was closed properly, so the output before the kill is readable
+    assert artifacts.tail_lines(os.path.join(run_dir, artifacts.LOG_NAME)) == "start\n"
+
+
+def test_tail_range_and_grep(run_root):
+    run_id, run_dir = artifacts.new_run()
+    artifacts.spool_text("".join(f"line {i}\n" for i in range(100)) + "ERROR boom\n", run_dir)
+
+    assert artifacts.get_run_artifact_fn(run_id, lines=2) == "line 99\nERROR boom\n"
+    assert artifacts.get_run_artifact_fn(run_id, mode="range", offset=7, length=6) == "line 1"
+    assert artifacts.get_run_artifact_fn(run_id, mode="grep", pattern="^ERROR") == "101: ERROR boom"
+    assert artifacts.get_run_artifact_fn(run_id, mode="grep", pattern="line", max_matches=2).splitlines() == [
+        "1: line 0", "2: line 1", "... stopped after 2 matches"
+    ]
+    assert artifacts.get_run_artifact_fn(run_id, mode="grep", pattern="nope") == "No lines matching 'nope'."
+
+
+def test_names_outside_the_run_are_rejected(run_root):
+    run_id, run_dir = artifacts.new_run()
+    (run_root / "secret.txt").write_text("secret")
+
+    for name in ("../secret.txt", f"../{run_id}/../secret.txt", "/etc/passwd"):
+        assert artifacts.get_run_artifact_fn(run_id, name=name).startswith("❌ Error reading artifact: Artifact outside")
+    assert artifacts.get_run_artifact_fn("../etc").startswith("❌ Error reading artifact: Invalid run id")
+
+
+def test_pruning_spares_recent_runs(run_root, monkeypatch):
+    monkeypatch.setattr(artifacts, "MAX_TOTAL_MB", 0)
+    _, recent = artifacts.new_run()
+    _, old = artifacts.new_run()
+    for run_dir in (recent, old):
+        artifacts.spool_text("log", run_dir)
+        artifacts.finish_run(run_dir)
+    _age(old, artifacts.ACTIVE_GRACE_SECONDS + 60)
+
+    artifacts.prune_runs()
+
+    assert os.path.isdir(recent)
+    assert not os.path.exists(old)
+
+
+def test_pruning_by_age(run_root):
+    _, expired = artifacts.new_run()
+    _, kept = artifacts.new_run()
+    for run_dir in (expired, kept):
+        artifacts.finish_run(run_dir)
+    _age(expired, artifacts.MAX_AGE_DAYS * 86400 + 60)
+    _age(kept, artifacts.ACTIVE_GRACE_SECONDS + 60)
+
+    artifacts.prune_runs()
+
+    assert not os.path.exists(expired)
+    assert os.path.isdir(kept)
+
+
+def test_marker_of_an_exited_server_is_ignored(run_root, monkeypatch):
+    monkeypatch.setattr(artifacts, "MAX_TOTAL_MB", 0)
+    _, run_dir = artifacts.new_run()
+    dead = subprocess.Popen(["true"])
+    dead.wait()
+    with open(os.path.join(run_dir, artifacts.ACTIVE_MARKER), "w") as f:
+        f.write(str(dead.pid))
+    _age(run_dir, artifacts.ACTIVE_GRACE_SECONDS + 60)
+
+    artifacts.prune_runs()
+
+    assert not os.path.exists(run_dir)
@@ -0,0 +1,17 @@
+import pytest
+
+import controllers.aws as aws
+
+
+@pytest.mark.parametrize("repo_url, ref", [
+    ("https://github.com/o/r$(touch /tmp/x)", ""),
+    ("https://github.com/o/r; rm -rf /", ""),
+    ("http://github.com/o/r", ""),
+    ("https://github.com/o/r", "main; reboot"),
+    ("https://github.com/o/r", "--upload-pack=x"),
+])
+def test_unsafe_repo_or_ref_is_rejected_before_ssm(repo_url, ref):
+    # No AWS mock: anything reaching boto3 would fail differently
+    result = aws.run_selenium_test_on_aws("i-0123456789abcdef0", repo_url, ref)
+
+    assert result.startswith((" Only GitHub", " Invalid git ref"))
@@ -0,0 +1,135 @@
+import json
+import boto3
+from botocore.exceptions import ClientError
+
+import controllers.aws as aws
+import controllers.history as history
+import controllers.placement as placement
+
+
+def _instance(instance_id):
+    ec2 = boto3.client("ec2", region_name="us-east-1")
+    return ec2.describe_instances(InstanceIds=[instance_id])["Reservations"][0]["Instances"][0]
+
+
+def test_new_suite_gets_cheapest_spot_zone(state_dir):
+    choice = placement.choose_placement()
+
+    assert choice["instance_type"] == "t3.micro"
+    assert choice["market"] == "spot"
+    assert choice["availability_zone"] == "us-east-1b"
+    assert choice["hourly_price"] == 0.0032
+
+
+def test_runner_sized_from_ec2_history(state_dir):
+    history.record_usage("https://github.com/o/r", {"peak_mem_mb": 2800, "cpu_s": 60, "duration_s": 60}, source="ec2")
+
+    choice = placement.choose_placement(suite="https://github.com/o/r")
+
+    # 2800 MB * 1.25 headroom only fits the 4 GiB+ types; t3.medium spot is cheapest
+    assert choice["needs"]["memory_mb"] == 3500
+    assert (choice["instance_type"], choice["availability_zone"]) == ("t3.medium", "us-east-1d")
+
+
+def test_ec2_history_wins_over_local_runs(state_dir):
+    suite = "https://github.com/o/r"
+    history.record_usage(suite, {"peak_mem_mb": 6000, "cpu_s": 10, "duration_s": 10}, source="local")
+    history.record_usage(suite, {"peak_mem_mb": 500, "cpu_s": 10, "duration_s": 10}, source="ec2")
+
+    assert placement.choose_placement(suite=suite)["instance_type"] == "t3.micro"
+
+
+def test_on_demand_only(state_dir):
+    choice = placement.choose_placement(allow_spot=False)
+
+    assert choice == {
+        "instance_type": "t3.micro",
+        "availability_zone": "",
+        "market": "on-demand",
+        "hourly_price": 0.0104,
+        "needs": history.DEFAULT_NEEDS,
+    }
+
+
+def test_stale_cache_is_refreshed_from_spot_history(state_dir, aws_account):
+    cache_path = state_dir / "prices.json"
+    cache = json.loads(cache_path.read_text())
+    cache["us-east-1/Linux/UNIX"]["fetched_at"] = 0
+    cache_path.write_text(json.dumps(cache))
+
+    choice = placement.choose_placement()
+
+    refreshed = json.loads(cache_path.read_text())["us-east-1/Linux/UNIX"]
+    assert refreshed["fetched_at"] > 0
+    assert refreshed["spot"]["t3.micro"]
+    assert choice["market"] == "spot"
+    assert choice["hourly_price"] == min(refreshed["spot"]["t3.micro"].values())
+
+
+def _fail_spot_launches(monkeypatch, code):
+    """Makes every spot run_instances call fail with the given error code."""
+    real_client = boto3.client
+    calls = []
+
+    def client(service, **kwargs):
+        c = real_client(service, **kwargs)
+        if service == "ec2":
+            run_instances = c.run_instances
+
+            def fail_spot(**params):
+                calls.append("spot" if "InstanceMarketOptions" in params else "on-demand")
+                if "InstanceMarketOptions" in params:
+                    raise ClientError({"Error": {"Code": code, "Message": code}}, "RunInstances")
+                return run_instances(**params)
+
+            c.run_instances = fail_spot
+        return c
+
+    monkeypatch.setattr(boto3, "client", client)
+    return calls
+
+
+def test_spot_launch_falls_back_to_on_demand(aws_account, monkeypatch):
+    calls = _fail_spot_launches(monkeypatch, "InsufficientInstanceCapacity")
+
+    result = aws.launch_ec2_with_ami(
+        ami_id=aws_account, key_name="k", market="spot", availability_zone="us-east-1b"
+    )
+
+    assert calls == ["spot", "on-demand"]
+    assert result["market"] == "on-demand"
+    assert "InstanceLifecycle" not in _instance(result["instance_id"])
+
+
+def test_spot_launch_does_not_mask_other_errors(aws_account, monkeypatch):
+    calls = _fail_spot_launches(monkeypatch, "UnauthorizedOperation")
+
+    result = aws.launch_ec2_with_ami(ami_id=aws_account, key_name="k", market="spot")
+
+    assert calls == ["spot"]
+    assert "UnauthorizedOperation" in result["error"]
+
+
+def test_interrupted_spot_run_is_requeued_on_demand(state_dir, aws_account, monkeypatch):
+    launched = []
+
+    def run_tests(instance_id, repo_url, ref=""):
+        launched.append(instance_id)
+        if len(launched) == 1:
+            # AWS reclaims the spot runner mid-run
+            boto3.client("ec2", region_name="us-east-1").terminate_instances(InstanceIds=[instance_id])
+            return "partial output"
+        return "all tests passed"
+
+    monkeypatch.setattr(aws, "wait_for_ssm_ready", lambda instance_id: True)
+    monkeypatch.setattr(aws, "run_selenium_test_on_aws", run_tests)
+
+    output = placement.run_on_placed_runner(
+        repo_url="https://github.com/o/r", ami_id=aws_account, key_name="k"
+    )
+
+    assert len(launched) == 2
+    assert _instance(launched[0])["InstanceLifecycle"] == "spot"
+    assert "InstanceLifecycle" not in _instance(launched[1])
+    assert _instance(launched[1])["State"]["Name"] in ("shutting-down", "terminated")
+    assert output == f"✅ EC2 Test Run Complete on {launched[1]}:\nall tests passed"